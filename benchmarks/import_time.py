@@ -0,0 +1,106 @@
+"""Measure the startup overhead pdm-plugin-torch adds to every pdm invocation.
+
+Run it with the interpreter that pdm and the plugin are installed into, from a
+directory containing a pdm project:
+
+    /path/to/pdm/venv/bin/python benchmarks/import_time.py --repeat 20
+
+It reports the modules and time spent loading the plugin itself, and the median
+wall time of `pdm --help` and `pdm run python -c pass` with and without the
+plugin. Other installed plugins are loaded in both cases.
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+
+DRIVER = """
+import sys
+import pdm.core
+
+if sys.argv[1] == "off":
+    entry_points = pdm.core.importlib_metadata.entry_points
+
+    def without_torch_plugin(**kwargs):
+        return [
+            ep
+            for ep in entry_points(**kwargs)
+            if not ep.value.startswith("pdm_plugin_torch")
+        ]
+
+    pdm.core.importlib_metadata.entry_points = without_torch_plugin
+
+pdm.core.main(sys.argv[2:])
+"""
+
+PLUGIN_LOAD = """
+import sys
+import time
+import pdm.core
+
+pdm.core.Core.load_plugins = lambda self: None
+core = pdm.core.Core()
+
+before = set(sys.modules)
+start = time.perf_counter()
+from pdm_plugin_torch.main import torch_plugin
+
+torch_plugin(core)
+elapsed = time.perf_counter() - start
+
+print(f"{elapsed * 1000:.2f}")
+for name in sorted(set(sys.modules) - before):
+    print(name)
+"""
+
+COMMANDS = {
+    "pdm --help": ["--help"],
+    "pdm run": ["run", "python", "-c", "pass"],
+}
+
+
+def time_command(args: list[str], plugin: str, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-c", DRIVER, plugin, *args],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        timings.append(time.perf_counter() - start)
+
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10, help="runs per command")
+    options = parser.parse_args()
+
+    output = subprocess.check_output([sys.executable, "-c", PLUGIN_LOAD], text=True)
+    elapsed, *modules = output.splitlines()
+    print(f"plugin load: {elapsed} ms, {len(modules)} new modules")
+    for name in modules:
+        print(f"  {name}")
+
+    for label, args in COMMANDS.items():
+        # Warm up caches and create the project environment if needed
+        time_command(args, "on", 1)
+
+        with_plugin = time_command(args, "on", options.repeat)
+        without_plugin = time_command(args, "off", options.repeat)
+        print(
+            f"{label}: {with_plugin:.1f} ms with the plugin, "
+            f"{without_plugin:.1f} ms without "
+            f"(+{with_plugin - without_plugin:.1f} ms)"
+        )
+
+
+if __name__ == "__main__":
+    main()
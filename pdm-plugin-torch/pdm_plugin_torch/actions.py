@@ -0,0 +1,704 @@
+from __future__ import annotations
+
+import contextlib
+import sys
+import threading
+
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Mapping
+
+import tomlkit
+
+from pdm import __version__, termui
+from pdm._types import RepositoryConfig
+from pdm.cli.utils import fetch_hashes, format_lockfile, format_resolution_impossible
+from pdm.environments.base import BaseEnvironment
+from pdm.models.candidates import Candidate
+from pdm.models.repositories import BaseRepository, LockedRepository
+from pdm.models.requirements import Requirement, parse_requirement
+from pdm.models.specifiers import PySpecSet, get_specifier
+from pdm.project import Project
+from pdm.resolver import resolve
+from pdm.resolver.providers import BaseProvider
+from pdm.termui import Verbosity
+from pdm.utils import atomic_open_for_write, expand_env_vars_in_auth
+from resolvelib.reporters import BaseReporter
+from resolvelib.resolvers import ResolutionImpossible, ResolutionTooDeep, Resolver
+
+from pdm_plugin_torch.cache import (
+    read_cached_resolution,
+    resolution_cache_key,
+    write_cached_resolution,
+)
+from pdm_plugin_torch.concurrency import (
+    CancellableReporter,
+    check_cancelled,
+    limit_repository,
+)
+from pdm_plugin_torch.config import Configuration
+from pdm_plugin_torch.layers import (
+    LayerEnvironment,
+    compile_layer,
+    create_staging_dir,
+    layer_name,
+    link_layer,
+    make_read_only,
+    remove_layer,
+)
+from pdm_plugin_torch.targets import (
+    NoMatchingFilesError,
+    prune_hashes,
+    restrict_repository,
+)
+
+
+if TYPE_CHECKING:
+    from pdm._types import Spinner
+
+
+is_pdm210 = PySpecSet(">=2.10").contains(__version__.__version__)
+is_pdm29 = PySpecSet(">=2.9").contains(__version__.__version__)
+is_pdm28 = PySpecSet(">=2.8").contains(__version__.__version__)
+
+
+def sources(project: Project, sources: list) -> list[RepositoryConfig]:
+    result: dict[str, RepositoryConfig] = {}
+    for source in project.pyproject.settings.get("source", []):
+        result[source["name"]] = RepositoryConfig(**source, config_prefix="pypi")
+
+    for source in sources:
+        result[source["name"]] = RepositoryConfig(**source, config_prefix="torch")
+
+    def merge_sources(other_sources: Iterable[tuple[str, RepositoryConfig]]) -> None:
+        for name, source in other_sources:
+            source.name = name
+            if name in result:
+                result[name].passive_update(source)
+            else:
+                result[name] = source
+
+    if not project.config.get("pypi.ignore_stored_index", False):
+        if "pypi" not in result:  # put pypi source at the beginning
+            result = {"pypi": project.default_source, **result}
+        else:
+            result["pypi"].passive_update(project.default_source)
+        merge_sources(project.project_config.iter_sources())
+        merge_sources(project.global_config.iter_sources())
+
+    for source in result.values():
+        assert source.url, "Source URL must not be empty"
+        source.url = expand_env_vars_in_auth(source.url)
+
+    return list(result.values())
+
+
+def get_provider(
+    project: Project,
+    raw_sources: list,
+    strategy: str = "all",
+    for_install: bool = False,
+    lockfile: dict = None,
+    tracked_names: Iterable[str] | None = None,
+    allow_prereleases: bool = False,
+) -> BaseProvider:
+    """Build a provider class for resolver.
+    :param strategy: the resolve strategy
+    :param tracked_names: the names of packages that needs to update
+    :param for_install: if the provider is for install
+    :returns: The provider object
+    """
+    from pdm.models.requirements import strip_extras
+    from pdm.resolver.providers import (
+        BaseProvider,
+        EagerUpdateProvider,
+        ReusePinProvider,
+    )
+    from pdm.utils import normalize_name
+
+    repository = get_repository(
+        project, raw_sources, for_install=for_install, lockfile=lockfile
+    )
+
+    overrides = {
+        normalize_name(k): v for k, v in project.pyproject.resolution_overrides.items()
+    }
+
+    locked_repository: LockedRepository | None = None
+    if strategy != "all" or for_install:
+        try:
+            locked_repository = LockedRepository(lockfile, sources, project.environment)
+        except Exception:
+            if for_install:
+                raise
+            project.core.ui.echo(
+                "Unable to reuse the lock file as it is not compatible with PDM",
+                style="warning",
+                err=True,
+            )
+
+    if locked_repository is None:
+        return BaseProvider(repository, allow_prereleases, overrides)
+
+    if for_install:
+        return BaseProvider(locked_repository, allow_prereleases, overrides)
+
+    provider_class = ReusePinProvider if strategy == "reuse" else EagerUpdateProvider
+    tracked_names = [strip_extras(name)[0] for name in tracked_names or ()]
+
+    return provider_class(
+        locked_repository.all_candidates,
+        tracked_names,
+        repository,
+        allow_prereleases,
+        overrides,
+    )
+
+
+def get_repository(
+    project: Project,
+    raw_sources: list,
+    cls: type[BaseRepository] | None = None,
+    for_install: bool = False,
+    lockfile: dict = None,
+) -> BaseRepository:
+    """Get the repository object"""
+    if cls is None:
+        cls = project.core.repository_class
+
+    fixed_sources = sources(project, raw_sources)
+    return cls(
+        fixed_sources,
+        project.environment,
+    )
+
+
+def do_lock(
+    project: Project,
+    raw_sources: list,
+    strategy: str = "all",
+    requirements: list[Requirement] | None = None,
+    local_version: str = "",
+    cache_dir: Path | None = None,
+    cache_ttl: int | None = None,
+    index_snapshot: str = "",
+    targets: Mapping[str, list[str]] | None = None,
+    spinner: Spinner | None = None,
+    request_limit: threading.BoundedSemaphore | None = None,
+    cancelled: threading.Event | None = None,
+) -> dict[str, Candidate]:
+    """Performs the locking process and update lockfile.
+
+    If `cache_dir` is given, a previous resolution with the same inputs is reused
+    as long as it is younger than `cache_ttl` seconds. If `targets` is given, only
+    files matching its `platforms` and `abis` are hashed and locked. If `spinner` is
+    given, it is used instead of opening a new spinner and log file, so several
+    locks can run at once. `request_limit` bounds the hash downloads shared with
+    other locks, and once `cancelled` is set the lock stops with `LockCancelled`
+    without writing to the cache or the output.
+    """
+
+    check_cancelled(cancelled)
+    ui = project.core.ui
+    cache_key = None
+    if cache_dir is not None:
+        cache_key = resolution_cache_key(
+            requirements or [],
+            local_version,
+            sources(project, raw_sources),
+            str(project.environment.python_requires),
+            project.pyproject.resolution_overrides,
+            strategy,
+            index_snapshot,
+            targets,
+            project.pyproject.settings.get("resolution", {}),
+        )
+        cached = read_cached_resolution(cache_dir, cache_key, cache_ttl)
+        if cached is not None:
+            ui.echo(f"{termui.Emoji.LOCK} Lock successful (cached)")
+            return cached
+
+    provider = get_provider(project, raw_sources, strategy)
+    if request_limit is not None:
+        limit_repository(provider.repository, request_limit, cancelled)
+    if targets:
+        restrict_repository(provider.repository, targets)
+
+    resolve_max_rounds = int(project.config["strategy.resolve_max_rounds"])
+    if spinner is None:
+        logging = ui.logging("lock")
+        open_spinner = ui.open_spinner(title="Resolving dependencies")
+    else:
+        logging = contextlib.nullcontext()
+        open_spinner = contextlib.nullcontext(spinner)
+
+    with logging:
+        # The context managers are nested to ensure the spinner is stopped before
+        # any message is thrown to the output.
+        try:
+            with open_spinner as spin:
+                reporter = project.get_reporter(requirements, None, spin)
+                if cancelled is not None:
+                    reporter = CancellableReporter(reporter, cancelled)
+                resolver: Resolver = project.core.resolver_class(provider, reporter)
+                mapping, dependencies = resolve(
+                    resolver,
+                    requirements,
+                    project.environment.python_requires,
+                    resolve_max_rounds,
+                )
+
+                spin.update("Fetching hashes for resolved packages...")
+                fetch_hashes(provider.repository, mapping)
+                # Errors of the hash downloads are not raised by fetch_hashes
+                check_cancelled(cancelled)
+                if targets:
+                    prune_hashes(mapping, targets)
+
+        except ResolutionTooDeep:
+            ui.echo(f"{termui.Emoji.LOCK} Lock failed", err=True)
+            ui.echo(
+                "The dependency resolution exceeds the maximum loop depth of "
+                f"{resolve_max_rounds}, there may be some circular dependencies "
+                "in your project. Try to solve them or increase the "
+                f"[green]`strategy.resolve_max_rounds`[/] config.",
+                err=True,
+            )
+            raise
+        except ResolutionImpossible as err:
+            ui.echo(f"{termui.Emoji.LOCK} Lock failed", err=True)
+            ui.echo(format_resolution_impossible(err), err=True)
+            raise ResolutionImpossible("Unable to find a resolution") from None
+        except NoMatchingFilesError as err:
+            ui.echo(f"{termui.Emoji.LOCK} Lock failed", err=True)
+            ui.echo(f"[error]{err}[/]", err=True)
+            raise
+        else:
+            if is_pdm210:
+                from pdm.project.lockfile import FLAG_STATIC_URLS
+
+                data = format_lockfile(
+                    project,
+                    mapping,
+                    dependencies,
+                    groups=[],
+                    strategy={FLAG_STATIC_URLS},
+                )
+
+            elif is_pdm29:
+                data = format_lockfile(project, mapping, dependencies, static_urls=True)
+
+            elif is_pdm28:
+                data = format_lockfile(project, mapping, dependencies, static_urls=True)
+
+            else:
+                data = format_lockfile(project, mapping, dependencies)
+
+            check_cancelled(cancelled)
+            if cache_key is not None:
+                write_cached_resolution(cache_dir, cache_key, data, cache_ttl)
+
+            ui.echo(f"{termui.Emoji.LOCK} Lock successful")
+            return data
+
+
+def write_lockfile(
+    project: Project, lock_name: str, toml_data: dict, show_message: bool = True
+) -> None:
+    toml_data["metadata"] = project.get_lock_metadata()
+    lockfile_file = project.root / lock_name
+
+    with atomic_open_for_write(lockfile_file) as fp:
+        tomlkit.dump(toml_data, fp)  # type: ignore
+    if show_message:
+        project.core.ui.echo(f"Torch locks are written to [success]{lockfile_file}[/].")
+
+
+def resolve_candidates_from_lockfile(
+    project: Project,
+    requirements: Iterable[Requirement],
+    raw_sources,
+    lockfile: dict,
+) -> dict[str, Candidate]:
+    ui = project.core.ui
+    resolve_max_rounds = int(project.config["strategy.resolve_max_rounds"])
+    reqs = [
+        req
+        for req in requirements
+        if not req.marker or req.marker.evaluate(project.environment.marker_environment)
+    ]
+    with ui.logging("install-resolve"):
+        with ui.open_spinner("Resolving packages from lockfile...") as spinner:
+            reporter = BaseReporter()
+            provider = get_provider(
+                project, raw_sources, for_install=True, lockfile=lockfile
+            )
+            resolver: Resolver = project.core.resolver_class(provider, reporter)
+            mapping, *_ = resolve(
+                resolver,
+                reqs,
+                project.environment.python_requires,
+                resolve_max_rounds,
+            )
+            spinner.update("Fetching hashes for resolved packages...")
+            fetch_hashes(provider.repository, mapping)
+
+    return mapping
+
+
+def do_sync(
+    project: Project,
+    *,
+    raw_sources: list,
+    requirements: list[Requirement] | None = None,
+    lockfile: dict,
+    environment: BaseEnvironment | None = None,
+    use_install_cache: bool | None = None,
+) -> None:
+    """Synchronize project
+
+    `use_install_cache` defaults to the `install.cache` config.
+    """
+
+    candidates = resolve_candidates_from_lockfile(
+        project, requirements, raw_sources, lockfile
+    )
+
+    handler = project.core.synchronizer_class(
+        candidates,
+        environment or project.environment,
+        clean=False,
+        dry_run=False,
+        no_editable=True,
+        install_self=False,
+        reinstall=False,
+        only_keep=False,
+        fail_fast=True,
+        use_install_cache=use_install_cache,
+    )
+
+    with project.core.ui.logging("install"):
+        handler.synchronize()
+
+
+def do_layered_sync(
+    project: Project,
+    *,
+    api: str,
+    layer_root: Path,
+    raw_sources: list,
+    requirements: list[Requirement] | None = None,
+    lockfile: dict,
+) -> None:
+    """Install the locked variant into a shared layer, unless it already exists, and
+    link the project environment to it."""
+    ui = project.core.ui
+    layer = layer_root / layer_name(project, api, lockfile)
+
+    if layer.exists():
+        ui.echo(
+            f"Reusing shared torch layer [success]{layer}[/].",
+            verbosity=Verbosity.DETAIL,
+        )
+    else:
+        # Install into a private staging directory and move it in place once
+        # complete and read-only, so concurrent installs never see a partial or
+        # writable layer.
+        staging = create_staging_dir(layer_root, layer.name)
+        try:
+            do_sync(
+                project,
+                raw_sources=raw_sources,
+                requirements=requirements,
+                lockfile=lockfile,
+                environment=LayerEnvironment(project, path=staging),
+                # Cached installs are symlinks into the private cache of the user
+                use_install_cache=False,
+            )
+            compile_layer(project, staging, layer)
+            make_read_only(staging)
+            staging.rename(layer)
+        except OSError:
+            remove_layer(staging)
+            if not layer.exists():
+                raise
+            # Another process created the same layer first
+        except BaseException:
+            remove_layer(staging)
+            raise
+
+    pth_file = link_layer(project, layer)
+    ui.echo(f"Linked shared torch layer [success]{layer}[/] in {pth_file}.")
+
+
+def read_lockfile(project: Project, lock_name: str) -> None:
+    lockfile_file = project.root / lock_name
+
+    data = tomlkit.parse(lockfile_file.read_text("utf-8"))
+    return data
+
+
+def is_lockfile_compatible(project: Project, lock_name: str) -> bool:
+    lockfile_file = project.root / lock_name
+    if not lockfile_file.exists():
+        return True
+
+    lockfile = read_lockfile(project, lock_name)
+    lockfile_version = str(lockfile.get("metadata", {}).get("lock_version", ""))
+    if not lockfile_version:
+        return False
+
+    if "." not in lockfile_version:
+        lockfile_version += ".0"
+
+    accepted = get_specifier(f"~={lockfile_version}")
+    return accepted.contains(project.lockfile.spec_version)
+
+
+def is_lockfile_hash_match(project: Project, lock_name: str) -> bool:
+    lockfile_file = project.root / lock_name
+    if not lockfile_file.exists():
+        return False
+
+    lockfile = read_lockfile(project, lock_name)
+    hash_in_lockfile = str(lockfile.get("metadata", {}).get("content_hash", ""))
+    if not hash_in_lockfile:
+        return False
+
+    algo, hash_value = hash_in_lockfile.split(":")
+    content_hash = project.pyproject.content_hash(algo)
+
+    return content_hash == hash_value
+
+
+def check_lockfile(project: Project, lock_name: str) -> str | None:
+    """Check if the lock file exists and is up to date. Return the update strategy."""
+    lockfile_file = project.root / lock_name
+    if not lockfile_file.exists():
+        project.core.ui.echo("Lock file does not exist", style="warning", err=True)
+        return False
+    elif not is_lockfile_compatible(project, lock_name):
+        project.core.ui.echo(
+            "Lock file version is not compatible with PDM, installation may fail",
+            style="yellow",
+            err=True,
+        )
+        return False
+    elif not is_lockfile_hash_match(project, lockfile_file):
+        project.core.ui.echo(
+            "Lock file hash doesn't match pyproject.toml, packages may be outdated",
+            style="yellow",
+            err=True,
+        )
+        return False
+    return True
+
+
+def variant_locks(
+    project: Project, plugin_config: Configuration
+) -> dict[str, tuple[list, dict]]:
+    """Collect the `do_lock` arguments for every variant."""
+    cache_dir = get_resolution_cache_dir(project, plugin_config)
+    locks = {}
+    for api, (url, local_version) in plugin_config.variants.items():
+        reqs = [
+            parse_requirement(f"{req}{local_version}", False)
+            for req in plugin_config.dependencies
+        ]
+
+        raw_sources = [
+            {
+                "name": "torch",
+                "url": url,
+                "type": "index",
+                "verify_ssl": True,
+            }
+        ]
+
+        locks[api] = (
+            raw_sources,
+            dict(
+                requirements=reqs,
+                local_version=local_version,
+                cache_dir=cache_dir,
+                cache_ttl=plugin_config.resolution_cache_ttl,
+                index_snapshot=plugin_config.index_snapshot,
+                targets=plugin_config.targets.get(api),
+            ),
+        )
+
+    return locks
+
+
+def do_lock_concurrently(
+    project: Project,
+    locks: dict[str, tuple[list, dict]],
+    jobs: int,
+    request_limit: threading.BoundedSemaphore,
+) -> dict[str, dict]:
+    """Lock all variants in a thread pool, running up to `jobs` resolves at a time.
+
+    Each resolve is still sequential, but the blocking index, metadata and hash
+    requests of different variants overlap. When a variant fails, the variants
+    that have not started yet are cancelled, running ones stop at their next
+    resolution round or hash download, and the error is raised right away.
+    """
+    ui = project.core.ui
+    cancelled = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=jobs)
+    futures = {}
+    try:
+        with ui.logging("lock"):
+            with ui.open_spinner(title="Resolving dependencies") as spin:
+                for api, (raw_sources, kwargs) in locks.items():
+                    futures[api] = executor.submit(
+                        do_lock,
+                        project,
+                        raw_sources,
+                        spinner=spin,
+                        request_limit=request_limit,
+                        cancelled=cancelled,
+                        **kwargs,
+                    )
+
+                done, _ = wait(futures.values(), return_when=FIRST_EXCEPTION)
+                for future in done:
+                    future.result()
+
+        return {api: future.result() for api, future in futures.items()}
+    finally:
+        cancelled.set()
+        for future in futures.values():
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def get_settings(project: Project):
+    return project.pyproject.settings["plugin"]["torch"]
+
+
+def get_resolution_cache_dir(
+    project: Project, plugin_config: Configuration
+) -> Path | None:
+    if not plugin_config.resolution_cache:
+        return None
+
+    if plugin_config.resolution_cache_dir:
+        return project.root / Path(plugin_config.resolution_cache_dir).expanduser()
+
+    return project.cache("torch-resolutions")
+
+
+def do_install(project: Project, api: str, shared_layer_dir: str | None = None) -> None:
+    """Install the locked packages of a variant into the project environment."""
+    plugin_config = Configuration.from_toml(get_settings(project))
+
+    resolves = plugin_config.variants
+    if api not in resolves:
+        raise ValueError(f"unknown API {api}, expected one of {[v for v in resolves]}")
+
+    lockfile = read_lockfile(project, plugin_config.lockfile)
+
+    spec_for_version = lockfile[api]
+
+    (source, local_version) = resolves[api]
+
+    if is_pdm210:
+        from pdm.project.lockfile import FLAG_STATIC_URLS
+
+        class OverrideLockfile:
+            def __init__(self, lockfile):
+                self._lockfile = lockfile
+
+            @property
+            def strategy(self):
+                strategies = self._lockfile.strategy
+                strategies.add(FLAG_STATIC_URLS)
+
+                return strategies
+
+            def __getattr__(self, name):
+                return getattr(self._lockfile, name)
+
+        original_lockfile = project.lockfile
+
+        project._lockfile = OverrideLockfile(original_lockfile)
+
+    reqs = [
+        parse_requirement(f"{req}{local_version}", False)
+        for req in plugin_config.dependencies
+    ]
+
+    raw_sources = [
+        {
+            "name": "torch",
+            "url": source,
+            "type": "index",
+            "verify_ssl": True,
+        }
+    ]
+
+    shared_layer_dir = shared_layer_dir or plugin_config.shared_layer_dir
+    if shared_layer_dir:
+        do_layered_sync(
+            project,
+            api=api,
+            layer_root=project.root / Path(shared_layer_dir).expanduser(),
+            raw_sources=raw_sources,
+            requirements=reqs,
+            lockfile=spec_for_version,
+        )
+    else:
+        do_sync(
+            project,
+            raw_sources=raw_sources,
+            requirements=reqs,
+            lockfile=spec_for_version,
+        )
+
+    if is_pdm210:
+        project._lockfile = original_lockfile
+
+
+def do_check(project: Project) -> None:
+    """Exit with a non-zero status if the torch lockfile is out of date."""
+    plugin_config = Configuration.from_toml(get_settings(project))
+
+    is_updated = check_lockfile(project, plugin_config.lockfile)
+    if not is_updated:
+        project.core.ui.echo(
+            "Lockfile is [error]out of date[/].",
+            err=True,
+            verbosity=Verbosity.DETAIL,
+        )
+        sys.exit(1)
+    else:
+        project.core.ui.echo(
+            "Lockfile is [success]up to date[/].",
+            err=True,
+            verbosity=Verbosity.DETAIL,
+        )
+        sys.exit(0)
+
+
+def do_lock_all(project: Project, jobs: int = 1, max_hash_requests: int = 32) -> None:
+    """Lock every configured variant and write the torch lockfile.
+
+    At most `max_hash_requests` hash downloads run at once, across all variants.
+    """
+    if max_hash_requests < 1:
+        raise ValueError(f"max_hash_requests must be positive, got {max_hash_requests}")
+
+    plugin_config = Configuration.from_toml(get_settings(project))
+    request_limit = threading.BoundedSemaphore(max_hash_requests)
+
+    locks = variant_locks(project, plugin_config)
+    if jobs > 1:
+        results = do_lock_concurrently(project, locks, jobs, request_limit)
+    else:
+        results = {
+            api: do_lock(project, raw_sources, request_limit=request_limit, **kwargs)
+            for api, (raw_sources, kwargs) in locks.items()
+        }
+
+    write_lockfile(project, plugin_config.lockfile, results)
@@ -0,0 +1,115 @@
+"""On-disk cache of resolution results, shared between projects locking the same
+torch variants.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from pathlib import Path
+from typing import Iterable, Mapping
+
+import tomlkit
+
+from pdm import __version__
+from pdm._types import RepositoryConfig
+from pdm.models.requirements import Requirement
+from tomlkit.exceptions import ParseError
+
+
+CACHE_VERSION = "1"
+
+
+def resolution_cache_key(
+    requirements: Iterable[Requirement],
+    local_version: str,
+    sources: Iterable[RepositoryConfig],
+    python_requires: str,
+    overrides: Mapping[str, str],
+    strategy: str,
+    index_snapshot: str = "",
+    targets: Mapping[str, list[str]] | None = None,
+    resolution_settings: Mapping | None = None,
+) -> str:
+    """Compute the cache key for a single variant resolution.
+
+    `resolution_settings` is the `[tool.pdm.resolution]` table of the project.
+    """
+    dump_data = {
+        "cache_version": CACHE_VERSION,
+        "pdm_version": __version__.__version__,
+        "requirements": sorted(req.as_line() for req in requirements),
+        "local_version": local_version,
+        "sources": [source.url for source in sources],
+        "python_requires": python_requires,
+        "overrides": dict(overrides),
+        "strategy": strategy,
+        "index_snapshot": index_snapshot,
+        "targets": dict(targets or {}),
+        "resolution_settings": dict(resolution_settings or {}),
+    }
+    content = json.dumps(dump_data, sort_keys=True)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def read_cached_resolution(
+    cache_dir: Path, key: str, ttl: int | None = None
+) -> dict | None:
+    """Return the cached lock data for `key`, or None if missing, expired or
+    invalid."""
+    cache_file = cache_dir / f"{key}.toml"
+    try:
+        if ttl is not None and time.time() - cache_file.stat().st_mtime > ttl:
+            return None
+
+        data = tomlkit.parse(cache_file.read_text("utf-8"))
+    except (OSError, ParseError):
+        return None
+
+    if not isinstance(data.get("package"), list):
+        return None
+
+    return data
+
+
+def write_cached_resolution(
+    cache_dir: Path, key: str, data: dict, ttl: int | None = None
+) -> None:
+    """Store lock data for `key`, and remove entries older than `ttl` seconds.
+
+    The entry is written to a temporary file and moved into place, so readers on
+    a shared filesystem never see a partial entry. Failures are ignored, the cache
+    is best-effort.
+    """
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, name = tempfile.mkstemp(prefix=f".{key}.", suffix=".tmp", dir=cache_dir)
+        try:
+            with open(fd, "w", encoding="utf-8") as fp:
+                tomlkit.dump(data, fp)  # type: ignore
+            os.chmod(name, 0o644)
+            os.replace(name, cache_dir / f"{key}.toml")
+        except BaseException:
+            os.unlink(name)
+            raise
+    except OSError:
+        pass
+
+    if ttl is not None:
+        prune_cached_resolutions(cache_dir, ttl)
+
+
+def prune_cached_resolutions(cache_dir: Path, ttl: int) -> None:
+    """Remove entries, and temporary files of interrupted writes, older than
+    `ttl` seconds."""
+    deadline = time.time() - ttl
+    for path in [*cache_dir.glob("*.toml"), *cache_dir.glob(".*.tmp")]:
+        try:
+            if path.stat().st_mtime < deadline:
+                path.unlink()
+        except OSError:
+            # Already removed by another project sharing the cache
+            pass
@@ -0,0 +1,70 @@
+"""Coordination between variants locked concurrently: a shared limit on hash
+downloads and cancellation of running locks.
+"""
+from __future__ import annotations
+
+import threading
+
+from typing import TYPE_CHECKING
+
+
+if TYPE_CHECKING:
+    from pdm.models.repositories import BaseRepository
+
+
+class LockCancelled(Exception):
+    """Raised in a running lock after another variant failed."""
+
+
+def check_cancelled(cancelled: threading.Event | None) -> None:
+    if cancelled is not None and cancelled.is_set():
+        raise LockCancelled("lock cancelled after another variant failed")
+
+
+class LimitedHashCache:
+    """Wraps a repository hash cache to bound the hash downloads running at once
+    across all repositories sharing `limit`, and to stop hashing once `cancelled`
+    is set.
+    """
+
+    def __init__(
+        self,
+        hash_cache,
+        limit: threading.BoundedSemaphore,
+        cancelled: threading.Event | None = None,
+    ) -> None:
+        self._hash_cache = hash_cache
+        self._limit = limit
+        self._cancelled = cancelled
+
+    def get_hash(self, link, session) -> str:
+        with self._limit:
+            check_cancelled(self._cancelled)
+            return self._hash_cache.get_hash(link, session)
+
+    def __getattr__(self, name):
+        return getattr(self._hash_cache, name)
+
+
+class CancellableReporter:
+    """Wraps a resolution reporter to stop the resolution at the start of the next
+    round once `cancelled` is set."""
+
+    def __init__(self, reporter, cancelled: threading.Event) -> None:
+        self._reporter = reporter
+        self._cancelled = cancelled
+
+    def starting_round(self, index: int) -> None:
+        check_cancelled(self._cancelled)
+        self._reporter.starting_round(index)
+
+    def __getattr__(self, name):
+        return getattr(self._reporter, name)
+
+
+def limit_repository(
+    repository: BaseRepository,
+    limit: threading.BoundedSemaphore,
+    cancelled: threading.Event | None = None,
+) -> None:
+    repository._hash_cache = LimitedHashCache(repository._hash_cache, limit, cancelled)
@@ -16,6 +16,23 @@ class Configuration:
 
     lockfile: str = "torch.lock"
 
+    resolution_cache: bool = False
+    resolution_cache_dir: str | None = None
+    resolution_cache_ttl: int | None = None
+    index_snapshot: str = ""
+
+    shared_layer_dir: str | None = None
+
+    targets: dict[str, dict[str, list[str]]] = field(default_factory=dict)
+
+    def __post_init__(self):
+        unknown = [api for api in self.targets if api not in self.variants]
+        if unknown:
+            raise ValueError(
+                f"targets for unknown variants {unknown}, "
+                f"expected one of {[v for v in self.variants]}"
+            )
+
     def from_toml(data: dict[str, str | list[str] | bool]) -> "Configuration":
         fixed_dashes = {k.replace("-", "_"): v for (k, v) in data.items()}
 
@@ -0,0 +1,118 @@
+"""Shared, read-only install layers that project environments link to instead of
+installing torch into every venv.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import stat
+import subprocess
+import uuid
+
+from pathlib import Path
+
+import tomlkit
+
+from pdm.environments.local import PythonLocalEnvironment
+from pdm.project import Project
+from pdm.utils import atomic_open_for_write
+
+
+PTH_NAME = "_pdm_plugin_torch.pth"
+
+
+class LayerEnvironment(PythonLocalEnvironment):
+    """An environment installing into a layer directory, with the same PEP 582
+    style scheme as `__pypackages__`.
+    """
+
+    def __init__(self, project: Project, *, path: Path) -> None:
+        super().__init__(project)
+        self.path = path
+
+    @property
+    def packages_path(self) -> Path:
+        return self.path
+
+
+def layer_name(project: Project, api: str, lockfile_section: dict) -> str:
+    """Name a layer after the variant, interpreter, platform and locked variant
+    content."""
+    content = tomlkit.dumps(lockfile_section)
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+    identifier = project.environment.interpreter.identifier
+    markers = project.environment.marker_environment
+    platform = f"{markers['sys_platform']}_{markers['platform_machine']}".lower()
+
+    return f"{api}-{identifier}-{platform}-{digest}"
+
+
+def create_staging_dir(layer_root: Path, name: str) -> Path:
+    """Create a uniquely named directory next to the final layer to install into.
+
+    The name is unique across hosts sharing `layer_root`. Unlike `mkdtemp`, the
+    directory gets the default permissions of the umask, like the installed files.
+    """
+    layer_root.mkdir(parents=True, exist_ok=True)
+    staging = layer_root / f".{name}.{uuid.uuid4().hex}.tmp"
+    staging.mkdir()
+
+    return staging
+
+
+def compile_layer(project: Project, staging: Path, layer: Path) -> None:
+    """Byte-compile the staged packages with the project interpreter, since the
+    published layer is read-only and Python cannot write the cache itself.
+
+    Tracebacks refer to the files at their final location in `layer`.
+    """
+    lib_path = LayerEnvironment(project, path=staging).get_paths()["purelib"]
+    final_lib_path = LayerEnvironment(project, path=layer).get_paths()["purelib"]
+    subprocess.run(
+        [
+            str(project.environment.interpreter.executable),
+            "-m",
+            "compileall",
+            "-q",
+            "-j",
+            "0",
+            "-d",
+            final_lib_path,
+            lib_path,
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def make_read_only(path: Path) -> None:
+    write_bits = ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            child = os.path.join(root, name)
+            if not os.path.islink(child):
+                os.chmod(child, os.stat(child).st_mode & write_bits)
+    for root, dirs, files in os.walk(path, topdown=False):
+        os.chmod(root, os.stat(root).st_mode & write_bits)
+
+
+def remove_layer(path: Path) -> None:
+    """Remove a layer or staging directory, even if it was made read-only."""
+    for root, dirs, files in os.walk(path):
+        os.chmod(root, os.stat(root).st_mode | stat.S_IWUSR)
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def link_layer(project: Project, layer: Path) -> Path:
+    """Make the layer importable from the project environment through a `.pth`
+    file. Replaces any previously linked layer.
+    """
+    lib_path = LayerEnvironment(project, path=layer).get_paths()["purelib"]
+    site_packages = Path(project.environment.get_paths()["purelib"])
+
+    pth_file = site_packages / PTH_NAME
+    with atomic_open_for_write(pth_file) as fp:
+        fp.write(f"{lib_path}\n")
+
+    return pth_file
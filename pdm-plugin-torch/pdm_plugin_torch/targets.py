@@ -0,0 +1,174 @@
+"""Restrict the files recorded for a variant to the wheels usable on its target
+platforms and ABIs.
+"""
+from __future__ import annotations
+
+import functools
+import re
+
+from typing import TYPE_CHECKING, Iterator, Mapping
+
+from packaging import tags
+from packaging.utils import InvalidWheelFilename, parse_wheel_filename
+
+
+if TYPE_CHECKING:
+    from pdm.models.candidates import Candidate
+    from pdm.models.repositories import BaseRepository
+
+
+# Placeholder for a tag component the targets do not constrain
+ANY = "*"
+
+LEGACY_MANYLINUX = {"manylinux1": 5, "manylinux2010": 12, "manylinux2014": 17}
+
+
+class NoMatchingFilesError(ValueError):
+    """Raised when no file of a locked package is usable on the targets."""
+
+
+def compatible_platforms(platform: str) -> Iterator[str]:
+    """Yield the platform tags installable on `platform`, most specific first.
+
+    manylinux targets accept every older glibc version and their legacy aliases,
+    macOS targets every older macOS version. Other platforms only match exactly.
+    """
+    match = re.fullmatch(
+        r"(?:manylinux(1|2010|2014)|manylinux_2_(\d+))_(\w+)", platform
+    )
+    if match:
+        legacy, glibc_minor, arch = match.groups()
+        newest = LEGACY_MANYLINUX[f"manylinux{legacy}"] if legacy else int(glibc_minor)
+        aliases = {minor: name for name, minor in LEGACY_MANYLINUX.items()}
+        for minor in range(newest, 4, -1):
+            yield f"manylinux_2_{minor}_{arch}"
+            if minor in aliases:
+                yield f"{aliases[minor]}_{arch}"
+        return
+
+    match = re.fullmatch(r"macosx_(\d+)_(\d+)_(\w+)", platform)
+    if match:
+        major, minor, arch = match.groups()
+        yield from tags.mac_platforms((int(major), int(minor)), arch)
+        return
+
+    yield platform
+
+
+def python_version(abi: str) -> tuple[int, int]:
+    match = re.fullmatch(r"cp(\d)(\d+)[dmu]*", abi)
+    if not match:
+        raise ValueError(f"unsupported abi {abi!r}, expected a CPython ABI like cp310")
+
+    return int(match.group(1)), int(match.group(2))
+
+
+@functools.lru_cache(maxsize=None)
+def supported_tags(platforms: tuple[str, ...], abis: tuple[str, ...]) -> frozenset:
+    """Build the set of wheel tags installable on any of the targets.
+
+    Components the targets leave open are set to `ANY`.
+    """
+    expanded = [tag for platform in platforms for tag in compatible_platforms(platform)]
+    if not abis:
+        return frozenset(
+            tags.Tag(ANY, ANY, platform) for platform in [*expanded, "any"]
+        )
+
+    expanded = expanded or [ANY]
+    result = set()
+    for abi in abis:
+        version = python_version(abi)
+        interpreter = f"cp{version[0]}{version[1]}"
+        result.update(tags.cpython_tags(version, abis=[abi], platforms=expanded))
+        result.update(tags.compatible_tags(version, interpreter, expanded))
+
+    return frozenset(result)
+
+
+def target_tags(targets: Mapping[str, list[str]]) -> frozenset:
+    return supported_tags(
+        tuple(targets.get("platforms", ())), tuple(targets.get("abis", ()))
+    )
+
+
+def is_target_file(filename: str, targets: Mapping[str, list[str]]) -> bool:
+    """Check whether a distribution file can be installed on one of the targets.
+
+    Source distributions are always kept.
+    """
+    try:
+        _, _, _, wheel_tags = parse_wheel_filename(filename)
+    except InvalidWheelFilename:
+        return not filename.endswith(".whl")
+
+    if not targets.get("platforms") and not targets.get("abis"):
+        return True
+
+    supported = target_tags(targets)
+    for tag in wheel_tags:
+        interpreter, abi = (
+            (tag.interpreter, tag.abi) if targets.get("abis") else (ANY, ANY)
+        )
+        platform = tag.platform if targets.get("platforms") else ANY
+        if tags.Tag(interpreter, abi, platform) in supported:
+            return True
+
+    return False
+
+
+class TargetHashCache:
+    """Wraps a repository hash cache to skip hashing files outside the targets."""
+
+    def __init__(self, hash_cache, targets: Mapping[str, list[str]]) -> None:
+        # Build the tags up front so invalid targets fail before resolution
+        target_tags(targets)
+        self._hash_cache = hash_cache
+        self._targets = targets
+
+    def get_hash(self, link, session) -> str:
+        if not is_target_file(link.filename, self._targets):
+            return ""
+
+        return self._hash_cache.get_hash(link, session)
+
+    def __getattr__(self, name):
+        return getattr(self._hash_cache, name)
+
+
+def restrict_repository(
+    repository: BaseRepository, targets: Mapping[str, list[str]]
+) -> None:
+    repository._hash_cache = TargetHashCache(repository._hash_cache, targets)
+
+
+def prune_hashes(
+    mapping: Mapping[str, Candidate], targets: Mapping[str, list[str]]
+) -> None:
+    """Drop hashes of files outside the targets, raising if nothing is left."""
+    for candidate in mapping.values():
+        if not candidate.hashes:
+            continue
+
+        if isinstance(candidate.hashes, dict):
+            # pdm < 2.9 stores a mapping of links to hashes
+            pruned = {
+                link: value
+                for link, value in candidate.hashes.items()
+                if is_target_file(link.filename, targets)
+            }
+        else:
+            pruned = [
+                item
+                for item in candidate.hashes
+                if is_target_file(item["file"], targets)
+            ]
+
+        if not pruned:
+            raise NoMatchingFilesError(
+                f"no files of {candidate.name} {candidate.version} match "
+                f"platforms {targets.get('platforms', [])} "
+                f"and abis {targets.get('abis', [])}"
+            )
+
+        candidate.hashes = pruned
@@ -0,0 +1,73 @@
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pytest
+
+from pdm_plugin_torch.concurrency import (
+    CancellableReporter,
+    LimitedHashCache,
+    LockCancelled,
+)
+
+
+class SlowHashCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def get_hash(self, link, session):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.01)
+        with self.lock:
+            self.running -= 1
+
+        return f"sha256:{link}"
+
+
+def test_hash_requests_are_limited_across_caches():
+    hash_cache = SlowHashCache()
+    limit = threading.BoundedSemaphore(3)
+    # One wrapper per variant, each hashing from its own thread pool
+    caches = [LimitedHashCache(hash_cache, limit) for _ in range(4)]
+
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        results = list(
+            executor.map(lambda i: caches[i % len(caches)].get_hash(i, None), range(64))
+        )
+
+    assert results == [f"sha256:{i}" for i in range(64)]
+    assert hash_cache.max_running == 3
+
+
+def test_cancelled_hash_cache_stops_hashing():
+    hash_cache = mock.Mock()
+    cancelled = threading.Event()
+    cache = LimitedHashCache(hash_cache, threading.BoundedSemaphore(1), cancelled)
+
+    cache.get_hash("link", None)
+    cancelled.set()
+    with pytest.raises(LockCancelled):
+        cache.get_hash("link", None)
+
+    assert hash_cache.get_hash.call_count == 1
+
+
+def test_cancelled_reporter_stops_resolution():
+    reporter = mock.Mock()
+    cancelled = threading.Event()
+    cancellable = CancellableReporter(reporter, cancelled)
+
+    cancellable.starting_round(0)
+    cancellable.pinning("torch")
+    cancelled.set()
+    with pytest.raises(LockCancelled):
+        cancellable.starting_round(1)
+
+    reporter.starting_round.assert_called_once_with(0)
+    reporter.pinning.assert_called_once_with("torch")
@@ -1,6 +1,7 @@
 import os
 import shutil
 import subprocess
+import time
 
 from pathlib import Path
 from unittest import mock
@@ -86,3 +87,78 @@ class TestPdmVariants:
         pdm(["torch", "-v", "lock"], tmpdir)
         pdm(["torch", "-v", "install", "cpu"], tmpdir)
         pdm(["run", "python", "-c", "'import torch'"], tmpdir)
+
+    @staticmethod
+    def test_lock_reuses_resolution_cache(tmpdir, pdm):
+        tmpdir_project("cpu-only-cached", tmpdir, pdm)
+        pdm(["torch", "-v", "lock"], tmpdir)
+        assert list((Path(tmpdir) / ".torch-cache").glob("*.toml"))
+
+        first = (Path(tmpdir) / "torch.lock").read_text("utf-8")
+        output = pdm(["torch", "-v", "lock"], tmpdir)
+        assert b"(cached)" in output
+        pdm(["torch", "-v", "lock", "--check"], tmpdir)
+
+        second = (Path(tmpdir) / "torch.lock").read_text("utf-8")
+        assert first == second
+
+    @staticmethod
+    def test_install_shared_layer(tmpdir, pdm):
+        layers = Path(tmpdir) / "layers"
+        for name in ("first", "second"):
+            project = Path(tmpdir) / name
+            tmpdir_project("cpu-only", project, pdm)
+            pdm(["torch", "-v", "lock"], project)
+            pdm(
+                ["torch", "-v", "install", "cpu", "--shared-layer-dir", str(layers)],
+                project,
+            )
+            pdm(["run", "python", "-c", "import torch"], project)
+
+        assert len(list(layers.iterdir())) == 1
+
+    @staticmethod
+    def test_lock_prunes_files_to_targets(tmpdir, pdm):
+        import tomlkit
+
+        tmpdir_project("cpu-only-targets", tmpdir, pdm)
+        pdm(["torch", "-v", "lock"], tmpdir)
+
+        lockfile = tomlkit.parse((Path(tmpdir) / "torch.lock").read_text("utf-8"))
+        files = [
+            item["url"]
+            for package in lockfile["cpu"]["package"]
+            if package["name"] == "torch"
+            for item in package["files"]
+        ]
+
+        assert files
+        assert all(url.endswith("linux_x86_64.whl") for url in files)
+
+    @staticmethod
+    def test_lock_concurrently_matches_sequential(tmpdir, pdm):
+        tmpdir_project("cpu-cuda", tmpdir, pdm)
+        lockfile = Path(tmpdir) / "torch.lock"
+
+        pdm(["torch", "-v", "lock"], tmpdir)
+        sequential = lockfile.read_bytes()
+
+        lockfile.unlink()
+        pdm(["torch", "-v", "lock", "--jobs", "2", "--max-hash-requests", "2"], tmpdir)
+        pdm(["torch", "-v", "lock", "--check"], tmpdir)
+
+        assert lockfile.read_bytes() == sequential
+
+    @staticmethod
+    def test_lock_expires_resolution_cache(tmpdir, pdm):
+        tmpdir_project("cpu-only-cached", tmpdir, pdm)
+        pdm(["torch", "-v", "lock"], tmpdir)
+
+        # Backdate the entries past the configured resolution-cache-ttl
+        expired = time.time() - 2 * 3600
+        for entry in (Path(tmpdir) / ".torch-cache").glob("*.toml"):
+            os.utime(entry, (expired, expired))
+
+        output = pdm(["torch", "-v", "lock"], tmpdir)
+        assert b"(cached)" not in output
+        pdm(["torch", "-v", "lock", "--check"], tmpdir)
@@ -0,0 +1,73 @@
+import pytest
+
+from pdm_plugin_torch.config import Configuration
+from pdm_plugin_torch.targets import is_target_file
+
+
+LINUX_CP310 = {
+    "platforms": ["linux_x86_64", "manylinux2014_x86_64"],
+    "abis": ["cp310"],
+}
+
+
+@pytest.mark.parametrize(
+    "filename",
+    [
+        "torch-2.0.0+cu118-cp310-cp310-linux_x86_64.whl",
+        "nvidia_cublas_cu12-12.1.3.1-py3-none-manylinux1_x86_64.whl",
+        "cryptography-41.0.0-cp37-abi3-manylinux_2_17_x86_64.manylinux2014_x86_64.whl",
+        "numpy-1.26.0-cp310-cp310-manylinux_2_12_x86_64.whl",
+        "six-1.16.0-py2.py3-none-any.whl",
+        "numpy-1.26.0.tar.gz",
+    ],
+)
+def test_target_file_is_kept(filename):
+    assert is_target_file(filename, LINUX_CP310)
+
+
+@pytest.mark.parametrize(
+    "filename",
+    [
+        "torch-2.0.0+cu118-cp39-cp39-linux_x86_64.whl",
+        "torch-2.0.0-cp310-none-macosx_11_0_arm64.whl",
+        "torch-2.0.0+cpu-cp310-cp310-win_amd64.whl",
+        "foo-1.0-cp38-none-linux_x86_64.whl",
+        # Requires glibc 2.28, newer than manylinux2014
+        "cryptography-41.0.0-cp37-abi3-manylinux_2_28_x86_64.whl",
+        "legacy-1.0-py2-none-any.whl",
+    ],
+)
+def test_other_file_is_pruned(filename):
+    assert not is_target_file(filename, LINUX_CP310)
+
+
+def test_only_platforms():
+    targets = {"platforms": ["macosx_11_0_arm64"]}
+
+    assert is_target_file("torch-2.0.0-cp39-none-macosx_11_0_arm64.whl", targets)
+    assert is_target_file(
+        "numpy-1.26.0-cp311-cp311-macosx_10_9_universal2.whl", targets
+    )
+    assert not is_target_file("torch-2.0.0-cp39-cp39-linux_x86_64.whl", targets)
+
+
+def test_only_abis():
+    targets = {"abis": ["cp311"]}
+
+    assert is_target_file("torch-2.0.0-cp311-cp311-win_amd64.whl", targets)
+    assert not is_target_file("torch-2.0.0-cp310-cp310-win_amd64.whl", targets)
+
+
+def test_unsupported_abi():
+    with pytest.raises(ValueError):
+        is_target_file("torch-2.0.0-cp311-cp311-win_amd64.whl", {"abis": ["pypy39"]})
+
+
+def test_targets_for_unknown_variant():
+    with pytest.raises(ValueError):
+        Configuration(
+            dependencies=["torch"],
+            enable_cuda=True,
+            cuda_versions=["cu118"],
+            targets={"cu117": {"abis": ["cp310"]}},
+        )